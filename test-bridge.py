@@ -17,7 +17,12 @@ DG-LAB 桥接模式测试脚本
 """
 
 import asyncio
-from datetime import datetime
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
 from pydglab_ws import (
     DGLabWSClient,
     StrengthOperationType,
@@ -26,6 +31,45 @@ from pydglab_ws import (
     FeedbackButton,
 )
 
+# 强度操作与通道的显示名称
+_OP_NAMES = {
+    StrengthOperationType.INCREASE: "增加",
+    StrengthOperationType.DECREASE: "减少",
+    StrengthOperationType.SET_TO: "设置为",
+}
+_CH_NAMES = {Channel.A: "A", Channel.B: "B"}
+
+# 交互命令中的通道与操作符
+_CHANNEL_KEYS = {"a": Channel.A, "b": Channel.B}
+_OP_KEYS = {
+    "+": StrengthOperationType.INCREASE,
+    "-": StrengthOperationType.DECREASE,
+    "=": StrengthOperationType.SET_TO,
+}
+
+# 日志时间戳缓存，同一秒内复用
+_last_ts_sec = 0
+_last_ts_str = ""
+
+
+def _ts() -> str:
+    """返回当前时间的 HH:MM:SS 字符串"""
+    global _last_ts_sec, _last_ts_str
+    sec = int(time.time())
+    if sec != _last_ts_sec:
+        _last_ts_sec = sec
+        _last_ts_str = time.strftime("%H:%M:%S", time.localtime(sec))
+    return _last_ts_str
+
+
+# 测试波形：10 个 100ms 的脉冲，每个脉冲为 8 字节 hex 字符串
+# 示例：0A0A320A0A640A0A (简单方波)
+_TEST_PULSES = ("0A0A320A0A640A0A",) * 10
+
+# 波形合并窗口（秒）；单帧最多发送的脉冲数，缓存达到该数量时立即发送
+_PULSE_FLUSH_WINDOW = 0.010
+_PULSE_BATCH_SIZE = 100
+
 
 class BridgeTestController:
     """桥接模式测试控制器"""
@@ -34,6 +78,16 @@ class BridgeTestController:
         self.client = DGLabWSClient(server_url)
         self.target_id = None
         self.running = False
+        self._stopped = asyncio.Event()
+        # 待发送的波形缓存，按通道合并后一次发送
+        self._pulse_buf = {Channel.A: [], Channel.B: []}
+        self._pulse_wake = asyncio.Event()
+        self._pulse_idle = asyncio.Event()
+        self._pulse_idle.set()
+        self._flusher = None
+        # 交互命令队列，None 表示结束
+        self.commands = asyncio.Queue()
+        self._register_handlers()
 
     async def connect(self):
         """连接到服务器"""
@@ -57,6 +111,7 @@ class BridgeTestController:
 
         if ret == RetCode.SUCCESS:
             print("✓ 绑定成功！")
+            self.running = True
             return True
         else:
             print(f"❌ 绑定失败: {ret}")
@@ -68,16 +123,10 @@ class BridgeTestController:
         """发送强度操作"""
         ret = await self.client.add_strength(channel, op_type, value)
 
-        timestamp = datetime.now().strftime("%H:%M:%S")
+        timestamp = _ts()
         if ret == RetCode.SUCCESS:
-            op_name = {
-                StrengthOperationType.INCREASE: "增加",
-                StrengthOperationType.DECREASE: "减少",
-                StrengthOperationType.SET_TO: "设置为",
-            }.get(op_type, str(op_type))
-
-            ch_name = "A" if channel == Channel.A else "B"
-            print(f"[{timestamp}] 📤 {ch_name}通道 {op_name} {value}")
+            op_name = _OP_NAMES.get(op_type, str(op_type))
+            print(f"[{timestamp}] 📤 {_CH_NAMES[channel]}通道 {op_name} {value}")
         else:
             print(f"[{timestamp}] ❌ 发送失败: {ret}")
 
@@ -85,60 +134,116 @@ class BridgeTestController:
         """发送清空操作"""
         ret = await self.client.clear_pulses(channel)
 
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        ch_name = "A" if channel == Channel.A else "B"
-
+        timestamp = _ts()
         if ret == RetCode.SUCCESS:
-            print(f"[{timestamp}] 📤 清空 {ch_name}通道")
+            print(f"[{timestamp}] 📤 清空 {_CH_NAMES[channel]}通道")
         else:
             print(f"[{timestamp}] ❌ 清空失败: {ret}")
 
-    async def send_pulse(self, channel: Channel, pulses: list):
-        """发送波形数据"""
-        ret = await self.client.add_pulses(channel, pulses)
+    async def send_pulse(self, channel: Channel, pulses: Iterable[str]):
+        """缓存波形数据，由后台任务在合并窗口内批量发送
+
+        返回时波形仅进入缓存，需要确认已发出时调用 flush()。
+        """
+        self._pulse_buf[channel].extend(pulses)
+        self._pulse_idle.clear()
+
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_pulses())
+        self._pulse_wake.set()
+
+    async def _flush_pulses(self):
+        """后台发送任务：被唤醒后等待一个合并窗口，再按通道统一发送"""
+        while True:
+            await self._pulse_wake.wait()
+            self._pulse_wake.clear()
+
+            full = any(
+                len(buf) >= _PULSE_BATCH_SIZE for buf in self._pulse_buf.values()
+            )
+            if not full and not self._stopped.is_set():
+                await asyncio.sleep(_PULSE_FLUSH_WINDOW)
+
+            for channel, buf in self._pulse_buf.items():
+                while buf:
+                    pulses = buf[:_PULSE_BATCH_SIZE]
+                    del buf[:_PULSE_BATCH_SIZE]
+                    try:
+                        await self._send_pulses(channel, pulses)
+                    except Exception as e:
+                        # 记录后继续发送其余批次，避免后台任务退出
+                        print(f"[{_ts()}] ❌ 发送波形失败: {e}")
+
+            if not any(self._pulse_buf.values()):
+                self._pulse_idle.set()
+
+            if self._stopped.is_set():
+                return
+
+    async def flush(self):
+        """等待缓存的波形全部发出"""
+        if self._flusher is not None and not self._flusher.done():
+            await self._pulse_idle.wait()
 
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        ch_name = "A" if channel == Channel.A else "B"
+    async def _send_pulses(self, channel: Channel, pulses: list):
+        """将一批波形发送到指定通道"""
+        ret = await self.client.add_pulses(channel, pulses)
 
+        timestamp = _ts()
         if ret == RetCode.SUCCESS:
-            print(f"[{timestamp}] 📤 发送波形到 {ch_name}通道 ({len(pulses)} 个脉冲)")
+            print(
+                f"[{timestamp}] 📤 发送波形到 {_CH_NAMES[channel]}通道 "
+                f"({len(pulses)} 个脉冲)"
+            )
         else:
             print(f"[{timestamp}] ❌ 发送波形失败: {ret}")
 
     async def listen_for_updates(self):
         """监听来自设备的状态更新"""
         print("\n📊 开始监听设备状态更新...\n")
-        self.running = True
-
-        # 注册回调
-        @self.client.on_strength_data
-        async def on_strength(strength_data):
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            print(
-                f"[{timestamp}] 📥 设备状态: "
-                f"A={strength_data.a}, B={strength_data.b}, "
-                f"MaxA={strength_data.a_limit}, MaxB={strength_data.b_limit}"
-            )
 
-        @self.client.on_client_disconnected
-        async def on_disconnected():
-            print("\n⚠️  目标设备断开连接")
-            self.running = False
-
-        @self.client.on_error_message
-        async def on_error(error_data):
-            print(f"\n❌ 服务器错误: {error_data}")
-
-        # 保持运行
+        # 保持运行，直到断开或关闭
         try:
-            while self.running:
-                await asyncio.sleep(0.1)
-        except KeyboardInterrupt:
+            await self._stopped.wait()
+        except asyncio.CancelledError:
             pass
 
+    def _register_handlers(self):
+        """注册客户端回调（仅在初始化时调用一次）"""
+        self.client.on_strength_data(self._on_strength)
+        self.client.on_client_disconnected(self._on_disconnected)
+        self.client.on_error_message(self._on_error)
+
+    async def _on_strength(self, strength_data):
+        """设备强度数据回调"""
+        print(
+            f"[{_ts()}] 📥 设备状态: "
+            f"A={strength_data.a}, B={strength_data.b}, "
+            f"MaxA={strength_data.a_limit}, MaxB={strength_data.b_limit}"
+        )
+
+    async def _on_disconnected(self):
+        """目标设备断开回调"""
+        print("\n⚠️  目标设备断开连接")
+        self.running = False
+        self._stopped.set()
+        self.commands.put_nowait(None)
+
+    async def _on_error(self, error_data):
+        """服务器错误消息回调"""
+        print(f"\n❌ 服务器错误: {error_data}")
+
     async def close(self):
         """关闭连接"""
         self.running = False
+        self._stopped.set()
+        # 发送尚未发出的波形
+        if self._flusher is not None:
+            self._pulse_wake.set()
+            try:
+                await self._flusher
+            except Exception as e:
+                print(f"\n❌ 波形发送任务异常: {type(e).__name__}: {e}")
         await self.client.close()
 
 
@@ -164,72 +269,109 @@ async def run_interactive_test(controller: BridgeTestController):
     # 启动监听任务
     listen_task = asyncio.create_task(controller.listen_for_updates())
 
+    # 启动唯一的输入线程，逐行投递到命令队列
+    # 使用独立的单线程池，避免长期占用默认线程池（DNS 解析等也依赖它）
+    stdin_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stdin")
+    # 上一条命令处理完毕后才允许输入线程显示下一个提示符
+    prompt_ready = threading.Event()
+    closing = threading.Event()
+    loop = asyncio.get_running_loop()
+    reader = loop.run_in_executor(
+        stdin_executor,
+        _stdin_reader,
+        controller.commands,
+        loop,
+        prompt_ready,
+        closing,
+    )
+
     try:
         while controller.running:
-            try:
-                # 非阻塞输入
-                cmd = await asyncio.wait_for(
-                    asyncio.get_event_loop().run_in_executor(None, input, "命令> "),
-                    timeout=1.0,
-                )
-                cmd = cmd.strip().lower()
-
-                if not cmd:
-                    continue
-
-                if cmd == "quit":
-                    break
+            prompt_ready.set()
+            cmd = await controller.commands.get()
+            if cmd is None:
+                break
 
-                elif cmd == "auto":
-                    print("\n🤖 开始自动测试...")
-                    await run_auto_test(controller)
-                    print("✓ 自动测试完成\n")
+            cmd = cmd.strip().lower()
+            if not cmd:
+                continue
 
-                elif cmd == "pulse":
-                    await run_pulse_test(controller)
+            if cmd == "quit":
+                break
 
-                elif cmd.startswith("a") or cmd.startswith("b"):
+            # 单条命令出错只报告，不结束会话
+            try:
+                handler = _COMMANDS.get(cmd)
+                if handler is not None:
+                    await handler(controller)
+                elif cmd[0] in _CHANNEL_KEYS:
                     await parse_and_send_command(controller, cmd)
-
                 else:
                     print("❌ 未知命令")
-
-            except asyncio.TimeoutError:
-                continue
-            except EOFError:
-                break
+            except Exception as e:
+                print(f"❌ 错误: {e}")
 
     except KeyboardInterrupt:
         print("\n\n🛑 收到中断信号")
 
     finally:
         controller.running = False
+        closing.set()
+        prompt_ready.set()
         listen_task.cancel()
 
+        # 未阻塞在 input() 的输入线程会随 closing 立即退出
+        await asyncio.wait({reader}, timeout=0.1)
+        if not reader.done():
+            # 输入线程仍阻塞在 input()，进程退出前需等待其返回
+            print("\n⏎ 按回车退出")
+        elif reader.exception() is not None:
+            print(f"\n❌ 输入线程异常: {reader.exception()}")
+        stdin_executor.shutdown(wait=False)
+
+
+def _stdin_reader(
+    queue: asyncio.Queue,
+    loop: asyncio.AbstractEventLoop,
+    prompt_ready: threading.Event,
+    closing: threading.Event,
+):
+    """在线程中逐行读取标准输入，EOF、quit 或会话结束时退出"""
+    while True:
+        # 等待上一条命令处理完，避免提示符先于命令输出
+        prompt_ready.wait()
+        prompt_ready.clear()
+        if closing.is_set():
+            return
+
+        try:
+            line = input("命令> ")
+        except EOFError:
+            line = None
+        except Exception as e:
+            print(f"\n❌ 读取输入失败: {type(e).__name__}: {e}")
+            line = None
+
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, line)
+        except RuntimeError:
+            # 事件循环已关闭
+            return
+
+        if line is None or line.strip().lower() == "quit":
+            return
+
 
 async def parse_and_send_command(controller: BridgeTestController, cmd: str):
     """解析并发送命令"""
     try:
-        if cmd == "ca":
-            await controller.send_clear(Channel.A)
-        elif cmd == "cb":
-            await controller.send_clear(Channel.B)
-        else:
-            channel = Channel.A if cmd[0] == "a" else Channel.B
-            op = cmd[1]
-            value = int(cmd[2:])
-
-            if op == "+":
-                op_type = StrengthOperationType.INCREASE
-            elif op == "-":
-                op_type = StrengthOperationType.DECREASE
-            elif op == "=":
-                op_type = StrengthOperationType.SET_TO
-            else:
-                print("❌ 无效操作符")
-                return
+        channel = _CHANNEL_KEYS[cmd[0]]
+        op_type = _OP_KEYS.get(cmd[1:2])
+        if op_type is None:
+            print("❌ 无效操作符")
+            return
 
-            await controller.send_strength(channel, op_type, value)
+        await controller.send_strength(channel, op_type, int(cmd[2:]))
 
     except ValueError:
         print("❌ 无效数值")
@@ -238,39 +380,34 @@ async def parse_and_send_command(controller: BridgeTestController, cmd: str):
 
 
 async def run_auto_test(controller: BridgeTestController):
-    """运行自动测试序列"""
+    """运行自动测试序列（A/B 通道相互独立，成对并发发送）"""
     tests = [
-        ("设置 A=50", Channel.A, StrengthOperationType.SET_TO, 50),
-        ("设置 B=50", Channel.B, StrengthOperationType.SET_TO, 50),
-        ("A通道 +10", Channel.A, StrengthOperationType.INCREASE, 10),
-        ("B通道 +10", Channel.B, StrengthOperationType.INCREASE, 10),
-        ("A通道 -20", Channel.A, StrengthOperationType.DECREASE, 20),
-        ("B通道 -20", Channel.B, StrengthOperationType.DECREASE, 20),
+        ("设置 A=50, B=50", StrengthOperationType.SET_TO, 50),
+        ("A/B通道 +10", StrengthOperationType.INCREASE, 10),
+        ("A/B通道 -20", StrengthOperationType.DECREASE, 20),
     ]
 
-    for desc, channel, op_type, value in tests:
+    for desc, op_type, value in tests:
         print(f"  • {desc}")
-        await controller.send_strength(channel, op_type, value)
+        await asyncio.gather(
+            controller.send_strength(Channel.A, op_type, value),
+            controller.send_strength(Channel.B, op_type, value),
+        )
         await asyncio.sleep(2)
 
     # 清空
-    print(f"  • 清空 A通道")
-    await controller.send_clear(Channel.A)
-    await asyncio.sleep(1)
-
-    print(f"  • 清空 B通道")
-    await controller.send_clear(Channel.B)
+    print(f"  • 清空 A/B通道")
+    await asyncio.gather(
+        controller.send_clear(Channel.A),
+        controller.send_clear(Channel.B),
+    )
 
 
 async def run_pulse_test(controller: BridgeTestController):
     """运行波形测试"""
     print("\n🌊 开始波形测试...")
 
-    # 创建一个简单的测试波形（10个100ms的脉冲）
-    # 每个脉冲格式为 8 字节 hex 字符串
-    # 示例：0A0A320A0A640A0A (简单方波)
-    test_pulse = "0A0A320A0A640A0A"
-    pulses = [test_pulse] * 10
+    pulses = _TEST_PULSES
 
     print(f"  • 发送 {len(pulses)} 个测试脉冲到 A 通道")
     await controller.send_pulse(Channel.A, pulses)
@@ -278,10 +415,27 @@ async def run_pulse_test(controller: BridgeTestController):
 
     print(f"  • 发送 {len(pulses)} 个测试脉冲到 B 通道")
     await controller.send_pulse(Channel.B, pulses)
+    await controller.flush()
 
     print("✓ 波形测试完成\n")
 
 
+async def run_auto_command(controller: BridgeTestController):
+    """运行自动测试命令"""
+    print("\n🤖 开始自动测试...")
+    await run_auto_test(controller)
+    print("✓ 自动测试完成\n")
+
+
+# 无参数的交互命令
+_COMMANDS = {
+    "auto": run_auto_command,
+    "pulse": run_pulse_test,
+    "ca": lambda c: c.send_clear(Channel.A),
+    "cb": lambda c: c.send_clear(Channel.B),
+}
+
+
 async def main():
     """主函数"""
     import sys
@@ -334,10 +488,10 @@ async def main():
     except KeyboardInterrupt:
         print("\n\n🛑 测试中断")
     except Exception as e:
-        print(f"\n❌ 错误: {e}")
-        import traceback
-
-        traceback.print_exc()
+        print(f"\n❌ 错误: {type(e).__name__}: {e}")
+        # 设置 DGLAB_DEBUG=1 时输出完整堆栈
+        if os.environ.get("DGLAB_DEBUG") == "1":
+            traceback.print_exc()
     finally:
         await controller.close()
         print("\n✓ 已断开连接")